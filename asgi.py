@@ -0,0 +1,2 @@
+# asgi.py
+from main import app  # ASGI entry point for Hypercorn: hypercorn -c file:hypercorn_conf.py asgi:app
@@ -0,0 +1,32 @@
+# build_embeddings.py
+import json
+import os
+import numpy as np
+import config  # Import the config file for the embedding model
+from texts import initial_texts
+from database_operations import get_embeddings, get_seed_paths, preprocess_text
+
+def build_seed_embeddings():
+    """
+    Embeds initial_texts once and writes the seed artifacts used by setup_collection,
+    so the database can be seeded without calling OpenAI.
+    """
+    embeddings = get_embeddings(initial_texts, model_name=config.OPENAI_EMBEDDING_MODEL)
+    if embeddings is None:
+        print("Failed to generate embeddings for the initial texts.")
+        return
+
+    # deepcut is slower than newmm but segments better, which is affordable offline for the seed corpus
+    processed_texts = [preprocess_text(text, engine="deepcut") for text in initial_texts]
+
+    os.makedirs(config.SEED_EMBEDDINGS_DIR, exist_ok=True)
+    embeddings_path, texts_path = get_seed_paths(config.OPENAI_EMBEDDING_MODEL)
+
+    np.save(embeddings_path, np.asarray(embeddings, dtype=np.float32))
+    with open(texts_path, "w", encoding="utf-8") as f:
+        json.dump(processed_texts, f, ensure_ascii=False)
+
+    print(f"Wrote {len(processed_texts)} seed embeddings to '{embeddings_path}' and texts to '{texts_path}'.")
+
+if __name__ == '__main__':
+    build_seed_embeddings()
@@ -3,11 +3,22 @@ OPENAI_API_KEY = ""  # Replace with your actual OpenAI API key
 
 # Model for embedding
 OPENAI_EMBEDDING_MODEL = "text-embedding-3-large"  # You can easily change this to "text-embedding-3-small"
+OPENAI_EMBEDDING_DIMENSIONS = 1024  # Shortened embedding size sent as "dimensions"; set to None for the model's full size
+
+# Directory for the on-disk embedding cache (avoids re-embedding repeated texts)
+EMBEDDING_CACHE_DIR = "./emb_cache"
+
+# Directory for the precomputed seed embeddings written by build_embeddings.py
+SEED_EMBEDDINGS_DIR = "./seed"
 
 # Model for OpenAI's Chat Completion
 CHAT_COMPLETION_MODEL = "gpt-4o-mini"  # You can change this to the model you want, e.g., "gpt-4"
 CHAT_COMPLETION_TEMPERATURE = 0.7  # Adjust the temperature for randomness
 
+# Semantic cache for chat replies
+SEMANTIC_CACHE_THRESHOLD = 0.925  # Minimum cosine (IP) similarity for a previous question to count as the same question
+SEMANTIC_CACHE_TTL = 86400  # Seconds a cached reply stays valid
+
 # LINE Messaging API Configuration
 LINE_CHANNEL_ACCESS_TOKEN = ''
 
@@ -1,11 +1,20 @@
-import openai
+import asyncio
+import base64
+import contextlib
+import functools
+import hashlib
+import os
+import time
+import diskcache
+import httpx
+import numpy as np
+import orjson
 from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility, db
-import requests
 import json
 import config  # Import API key from config file
 from texts import initial_texts
 from pythainlp.util import normalize
-from pythainlp.tokenize import word_tokenize
+from pythainlp.tokenize import Tokenizer, word_tokenize
 
 # Milvus connection details
 MILVUS_HOST = 'localhost'
@@ -14,23 +23,57 @@ MILVUS_PORT = '19530'
 # Database and collection name variables
 database_name = "my_database"
 collection_name = "thai_text_embeddings"
+qa_cache_collection_name = "qa_cache"
 
-# Set the OpenAI API key from the config file
-openai.api_key = config.OPENAI_API_KEY
+# Maximum number of texts sent to the OpenAI embeddings endpoint in one request
+EMBEDDING_BATCH_SIZE = 96
+
+# Maximum number of embedding requests in flight at the same time
+EMBEDDING_MAX_CONCURRENCY = 8
+
+# OpenAI calls are retried on rate limits and transient server errors, with exponential backoff
+OPENAI_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+OPENAI_MAX_RETRIES = 3
+OPENAI_BACKOFF_FACTOR = 0.5  # Seconds before the first retry, doubled on each following retry
+
+# Similarity metric for all indexes and searches. OpenAI embeddings are unit-norm, so inner product
+# ranks like L2 but skips the norm terms. Collections indexed with another metric must be re-indexed.
+METRIC_TYPE = "IP"
+INDEX_PARAMS = {"index_type": "HNSW", "metric_type": METRIC_TYPE, "params": {"M": 16, "efConstruction": 200}}
+
+# HNSW search breadth (must be at least top_k); higher values improve recall at some latency cost
+DEFAULT_SEARCH_EF = 64
+SEARCH_PARAMS = {"metric_type": METRIC_TYPE, "params": {"ef": DEFAULT_SEARCH_EF}}
+
+# OpenAI request headers, built once and reused by every OpenAI call (also imported by the webhook apps)
+OPENAI_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {config.OPENAI_API_KEY}"  # Load API key from config
+}
+
+# Persistent on-disk cache of text -> embedding, shared across restarts
+embedding_cache = diskcache.Cache(config.EMBEDDING_CACHE_DIR)
+
+def _ensure_connection():
+    """
+    Opens the single persistent Milvus connection for the process on first use.
+    It starts on the default database and switches with db.using_database once ours exists.
+    """
+    if not connections.has_connection("default"):
+        connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
 
 def remove_existing_database():
     """
     Removes the existing database and all its collections.
     """
-    # Connect to Milvus
-    connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
-    
+    _ensure_connection()
+
     # Check if the database exists
     if database_name in db.list_database():
         print(f"Database '{database_name}' exists. Proceeding to drop all collections.")
         
         # Use the existing database
-        connections.connect(host=MILVUS_HOST, port=MILVUS_PORT, db_name=database_name)
+        db.using_database(database_name)
         
         # List and drop all collections
         collections = utility.list_collections()
@@ -46,52 +89,197 @@ def remove_existing_database():
     
     # Create a new database
     db.create_database(database_name)
+    db.using_database(database_name)
     print(f"Database '{database_name}' created.")
 
-def generate_embeddings_openai(text, model_name):
+def decode_embeddings(result):
+    """
+    Decodes the base64 embeddings of an OpenAI embeddings response into float32 NumPy arrays.
+    """
+    return [np.frombuffer(base64.b64decode(d['embedding']), dtype=np.float32) for d in result['data']]
+
+def create_async_client():
+    """
+    Creates an httpx.AsyncClient with HTTP/2 and a shared connection pool for OpenAI and LINE calls.
+    The client must be used from a single event loop.
+    """
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=64),
+        retries=3  # Retry failed connection attempts
+    )
+    return httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(30, connect=3.05))
+
+async def post_openai_with_retry(client, url, data):
+    """
+    POSTs the JSON body to an OpenAI endpoint, retrying 429/5xx responses with exponential backoff.
+    Returns the last response; the caller checks its status.
+    """
+    content = orjson.dumps(data)
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(OPENAI_BACKOFF_FACTOR * 2 ** (attempt - 1))
+        response = await client.post(url, headers=OPENAI_HEADERS, content=content)
+        if response.status_code not in OPENAI_RETRY_STATUSES:
+            break
+    return response
+
+@contextlib.asynccontextmanager
+async def stream_openai_with_retry(client, url, data):
+    """
+    Streaming version of post_openai_with_retry: yields the streamed response of the first attempt
+    that is not a 429/5xx, or the last one once the retries are used up.
+    """
+    content = orjson.dumps(data)
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(OPENAI_BACKOFF_FACTOR * 2 ** (attempt - 1))
+        async with client.stream("POST", url, headers=OPENAI_HEADERS, content=content) as response:
+            if response.status_code in OPENAI_RETRY_STATUSES and attempt < OPENAI_MAX_RETRIES:
+                continue
+            yield response
+            return
+
+async def generate_embeddings_openai_async(client, texts, model_name):
     """
-    Generates embeddings (vectors) using the OpenAI API via an HTTP POST request.
+    Generates embeddings (vectors) for a list of texts with a single OpenAI API request,
+    using a shared httpx.AsyncClient. Returns the embeddings in the same order as the input texts.
     """
     url = "https://api.openai.com/v1/embeddings"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {config.OPENAI_API_KEY}"  # Load API key from config
-    }
     data = {
-        "input": text,
-        "model": model_name  # Use the passed model name
+        "input": texts,
+        "model": model_name,
+        "dimensions": get_embedding_dim(model_name),
+        "encoding_format": "base64"
     }
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data))
+        response = await post_openai_with_retry(client, url, data)
         response.raise_for_status()  # Raise an exception for HTTP errors
-        result = response.json()
+        result = orjson.loads(response.content)
 
-        # Extract and return the embedding from the response
-        embeddings = result['data'][0]['embedding']
-        return embeddings
-    except requests.exceptions.HTTPError as http_err:
+        return decode_embeddings(result)
+    except httpx.HTTPStatusError as http_err:
         print(f"HTTP error occurred: {http_err}")
     except Exception as e:
         print(f"Error generating embeddings with OpenAI: {e}")
-        return None
+    return None
+
+async def generate_embeddings_batched_async(client, texts, model_name):
+    """
+    Splits the texts into batches and sends the batches to OpenAI concurrently.
+    Returns the embeddings in the same order as the input texts.
+    """
+    # Sort by length so each batch holds texts of similar size, keeping the original index
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches = [order[start:start + EMBEDDING_BATCH_SIZE] for start in range(0, len(order), EMBEDDING_BATCH_SIZE)]
+
+    semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENCY)  # Cap the number of in-flight requests
+
+    async def embed(batch):
+        async with semaphore:
+            return await generate_embeddings_openai_async(client, [texts[i] for i in batch], model_name)
+
+    results = await asyncio.gather(*[embed(batch) for batch in batches])
+
+    # Put the embeddings back into the original order of the texts
+    embeddings = [None] * len(texts)
+    for batch, batch_embeddings in zip(batches, results):
+        if batch_embeddings is None:
+            return None
+        for i, embedding in zip(batch, batch_embeddings):
+            embeddings[i] = embedding
+    return embeddings
+
+def _embedding_cache_key(text, model_name):
+    """
+    Builds the cache key for a text embedded with the given model and dimension.
+    """
+    return hashlib.sha256((f"{model_name}\x00{get_embedding_dim(model_name)}\x00" + text).encode()).hexdigest()
+
+@functools.lru_cache(maxsize=2048)
+def _load_cached_embedding(key):
+    """
+    Loads an embedding from the disk cache, keeping hot entries in process memory.
+    Raises KeyError on a miss so that misses are not memoized.
+    """
+    value = embedding_cache.get(key)
+    if value is None:
+        raise KeyError(key)
+    return np.frombuffer(value, dtype=np.float32)  # Read-only, so it is safe to share between callers
+
+def _lookup_cached_embeddings(keys):
+    """
+    Looks up the keys in the embedding cache.
+    Returns the embeddings (None for misses) and the indexes of the missing keys.
+    """
+    embeddings = [None] * len(keys)
+    missing = []
+    for i, key in enumerate(keys):
+        try:
+            embeddings[i] = _load_cached_embedding(key)
+        except KeyError:
+            missing.append(i)
+    return embeddings, missing
+
+def _store_cached_embeddings(keys, embeddings):
+    """
+    Writes the embeddings to the on-disk cache under the given keys.
+    """
+    for key, embedding in zip(keys, embeddings):
+        embedding_cache.set(key, np.asarray(embedding, dtype=np.float32).tobytes())
+
+async def get_embeddings_async(client, texts, model_name):
+    """
+    Returns the embeddings for the texts, calling OpenAI only for texts that are not cached yet.
+    """
+    keys = [_embedding_cache_key(text, model_name) for text in texts]
+
+    # diskcache reads and writes are blocking SQLite calls, so run them in a worker thread
+    embeddings, missing = await asyncio.to_thread(_lookup_cached_embeddings, keys)
+
+    if missing:
+        fetched = await generate_embeddings_batched_async(client, [texts[i] for i in missing], model_name)
+        if fetched is None:
+            return None
+        await asyncio.to_thread(_store_cached_embeddings, [keys[i] for i in missing], fetched)
+        for i, embedding in zip(missing, fetched):
+            embeddings[i] = embedding
+
+    return embeddings
+
+def get_embeddings(texts, model_name):
+    """
+    Synchronous wrapper around get_embeddings_async for code that is not running in an event loop.
+    """
+    async def run():
+        async with create_async_client() as client:
+            return await get_embeddings_async(client, texts, model_name)
+
+    return asyncio.run(run())
+
+def get_embedding_dim(model_name):
+    """
+    Returns the embedding dimension produced by the given model.
+    """
+    if config.OPENAI_EMBEDDING_DIMENSIONS:
+        return config.OPENAI_EMBEDDING_DIMENSIONS  # Shortened embeddings requested via the "dimensions" parameter
+    if model_name == "text-embedding-3-large":
+        return 3072  # Dimension for large model
+    return 1536  # Dimension for small model (default)
 
 def create_collection(model_name):
     """
     Defines the schema for the collection and creates the collection in Milvus.
     Returns the collection.
     """
-    # Determine the embedding dimension based on the model used
-    if model_name == "text-embedding-3-large":
-        embedding_dim = 3072  # Set dimension for large model
-    else:
-        embedding_dim = 1536  # Set dimension for small model (default)
+    embedding_dim = get_embedding_dim(model_name)
 
     # Define the fields schema (primary key, text, and embedding vector)
     fields = [
         FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),  # Auto-generated ID
         FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=1000),  # Store the original text
-        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=embedding_dim)  # Adjusted embedding dimensions
+        FieldSchema(name="embedding", dtype=DataType.FLOAT16_VECTOR, dim=embedding_dim)  # Adjusted embedding dimensions, stored as float16
     ]
     
     # Define the collection schema
@@ -107,44 +295,69 @@ def create_collection(model_name):
     
     return collection
 
-# Improved function to preprocess Thai text using deepcut tokenizer
-def preprocess_text(text: str) -> str:
+# Tokens removed during preprocessing
+_PUNCT = frozenset({',', ' ', '\u200b', ''})
+
+# newmm tokenizer with its dictionary trie built once at import instead of on every call
+_TOKENIZER = Tokenizer(engine="newmm", keep_whitespace=False)
+
+# Function to preprocess Thai text; newmm by default, deepcut can be used offline for the seed corpus
+@functools.lru_cache(maxsize=4096)
+def preprocess_text(text: str, engine: str = "newmm") -> str:
     # Normalize text (e.g., remove extra spaces, standardize characters)
     text = normalize(text)
 
-    # Tokenize the text using deepcut for better segmentation
-    tokens = word_tokenize(text, engine="deepcut")  # Switch to deepcut tokenizer
-
-    # Remove empty tokens and join them back with a single space
-    tokens = [token for token in tokens if token.strip()]
+    # Tokenize with the preloaded newmm tokenizer unless another engine is requested
+    if engine == "newmm":
+        tokens = _TOKENIZER.word_tokenize(text)
+    else:
+        tokens = word_tokenize(text, engine=engine, keep_whitespace=False)
 
-    # Optional: Remove commas if necessary
-    tokens = [token for token in tokens if token != ',']
+    # Strip tokens and drop empty tokens and punctuation in a single pass
+    tokens = [stripped for token in tokens if (stripped := token.strip()) and stripped not in _PUNCT]
 
     # Return preprocessed text
     return " ".join(tokens)
 
-def insert_texts(collection, text, embedding):
+def normalize_embeddings(embeddings):
+    """
+    L2-normalizes the embeddings so that inner product (IP) equals cosine similarity,
+    and converts them to float16 to match the FLOAT16_VECTOR field.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return (embeddings / np.maximum(norms, 1e-12)).astype(np.float16)
+
+def insert_texts(collection, texts, embeddings):
     """
-    Inserts a single text and its corresponding embedding into the specified Milvus collection.
+    Inserts a batch of texts and their corresponding embeddings into the specified Milvus collection.
     """
-    # Prepare data for insertion (text and corresponding embedding)
+    # Prepare data for insertion (parallel lists of texts and normalized embeddings)
     data = [
-        [text],        # Text field: wrapped in a list to match Milvus' insertion format
-        [embedding]    # Embedding field: also wrapped in a list
+        texts,                                   # Text field
+        list(normalize_embeddings(embeddings))   # Embedding field
     ]
     
-    # Insert the data into the collection
+    # Insert the whole batch into the collection in one call
     collection.insert(data)
-    print(f"Inserted text: '{text}' into the collection.")
-    
-    # Ensure the data is saved
-    collection.flush()
+    print(f"Inserted {len(texts)} texts into the collection.")
 
 
+def is_collection_current(collection, model_name):
+    """
+    Checks whether the collection's embedding field and index match the current configuration:
+    a FLOAT16_VECTOR field of get_embedding_dim(model_name) dimensions, indexed with METRIC_TYPE.
+    """
+    embedding_field = next((field for field in collection.schema.fields if field.name == "embedding"), None)
+    if embedding_field is None or embedding_field.dtype != DataType.FLOAT16_VECTOR:
+        return False
+    if int(embedding_field.params.get("dim", 0)) != get_embedding_dim(model_name):
+        return False
+    return any(index.params.get("metric_type") == METRIC_TYPE for index in collection.indexes)
+
 def create_index(collection):
     """
-    Creates an index on the 'embedding' field for faster search.
+    Creates an HNSW index on the 'embedding' field for faster search.
     """
     # Check if an index already exists
     indexes = collection.indexes
@@ -152,54 +365,177 @@ def create_index(collection):
         print(f"An index already exists on the collection '{collection_name}'.")
     else:
         # Create an index on the "embedding" field
-        index_params = {"index_type": "IVF_FLAT", "metric_type": "L2", "params": {"nlist": 128}}
-        collection.create_index(field_name="embedding", index_params=index_params)
+        collection.create_index(field_name="embedding", index_params=INDEX_PARAMS)
         print(f"Index created on 'embedding' field for collection '{collection_name}'.")
 
-def search_similar_texts(collection, query_embedding, top_k=5):
+def search_similar_texts(collection, query_embedding, top_k=5, ef=DEFAULT_SEARCH_EF):
     """
     Searches for texts similar to the query_embedding and returns the results in a structured format.
+    The collection must already be loaded (see initialize_database).
     """
     
-    # Define the search parameters
-    search_params = {"metric_type": "L2", "params": {"nprobe": 10}}
-    
-    # Load collection into memory for search
-    collection.load()
+    # Reuse the module-level search parameters unless a different ef is requested
+    search_params = SEARCH_PARAMS if ef == DEFAULT_SEARCH_EF else {"metric_type": METRIC_TYPE, "params": {"ef": ef}}
     
     # Perform similarity search
     results = collection.search(
-        [query_embedding],
+        [normalize_embeddings(query_embedding)],
         "embedding",
         param=search_params,
         limit=top_k,
-        output_fields=["id", "text"]
+        output_fields=["text"]  # The primary key is always returned, so only the text is requested
     )
     
-    # Prepare the results in a structured format to return
-    json_results = []
-    for result in results[0]:
-        result_json = {
-            "ID": result.id,
-            "Text": result.entity.get("text"),  # Extract the text from the search result
-            "Distance": result.distance
+    # Prepare the results in a structured format to return, reading each hit only once
+    json_results = [
+        {
+            "ID": hit.id,
+            "Text": hit.entity.get("text"),  # Extract the text from the search result
+            "Distance": hit.distance
         }
-        #print(json.dumps(result_json, indent=4, ensure_ascii=False))  # Print each JSON result with `ensure_ascii=False`
-        json_results.append(result_json)
+        for hit in results[0]
+    ]
     
     # Return the results for further processing (instead of printing them)
     return json_results
 
+# Minimum seconds between purges of expired semantic cache entries (per process)
+QA_CACHE_PURGE_INTERVAL = 600
+_last_qa_cache_purge = 0
+
+def create_qa_cache_collection(model_name):
+    """
+    Creates the semantic cache collection that stores query embeddings and their chat replies.
+    Returns the collection.
+    """
+    embedding_dim = get_embedding_dim(model_name)
+
+    # Define the fields schema (primary key, query embedding, reply text, and insertion timestamp)
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),  # Auto-generated ID
+        FieldSchema(name="embedding", dtype=DataType.FLOAT16_VECTOR, dim=embedding_dim),  # Query embedding, stored as float16
+        FieldSchema(name="reply", dtype=DataType.VARCHAR, max_length=65535),  # Cached chat completion reply
+        FieldSchema(name="ts", dtype=DataType.INT64)  # Unix time of insertion, used as TTL
+    ]
+
+    schema = CollectionSchema(fields, description=f"Semantic cache of chat replies (dim={embedding_dim})")
+
+    if utility.has_collection(qa_cache_collection_name):
+        qa_cache = Collection(qa_cache_collection_name)
+        if is_collection_current(qa_cache, model_name):
+            print(f"Collection '{qa_cache_collection_name}' already exists.")
+            return qa_cache
+
+        # The cache only holds derived data, so an outdated one is simply rebuilt
+        utility.drop_collection(qa_cache_collection_name)
+        print(f"Dropped collection '{qa_cache_collection_name}' with an outdated schema or index.")
+
+    qa_cache = Collection(name=qa_cache_collection_name, schema=schema)
+    qa_cache.create_index(field_name="embedding", index_params=INDEX_PARAMS)
+    print(f"Collection '{qa_cache_collection_name}' created with embedding dimension: {embedding_dim}.")
+    return qa_cache
+
+def search_cached_reply(qa_cache, query_embedding):
+    """
+    Returns the cached reply of the closest previous query if it is above the similarity threshold
+    and younger than the TTL, otherwise None.
+    """
+    # Milvus has no native TTL, so expired entries are filtered out at read time
+    min_ts = int(time.time()) - config.SEMANTIC_CACHE_TTL
+    results = qa_cache.search(
+        [normalize_embeddings(query_embedding)],
+        "embedding",
+        param=SEARCH_PARAMS,
+        limit=1,
+        expr=f"ts > {min_ts}",
+        output_fields=["reply"]
+    )
+
+    for result in results[0]:
+        if result.distance >= config.SEMANTIC_CACHE_THRESHOLD:  # With IP, a larger distance means more similar
+            return result.entity.get("reply")
+    return None
+
+def insert_cached_reply(qa_cache, query_embedding, reply):
+    """
+    Stores a query embedding and its chat reply in the semantic cache,
+    and deletes expired entries at most once per QA_CACHE_PURGE_INTERVAL.
+    """
+    global _last_qa_cache_purge
+    now = int(time.time())
+    qa_cache.insert([
+        [normalize_embeddings(query_embedding)],
+        [reply],
+        [now]
+    ])
+
+    # Milvus has no native TTL, so expired entries are purged here to keep the collection from growing forever
+    if now - _last_qa_cache_purge >= QA_CACHE_PURGE_INTERVAL:
+        _last_qa_cache_purge = now
+        qa_cache.delete(f"ts <= {now - config.SEMANTIC_CACHE_TTL}")
+
+def initialize_qa_cache():
+    """
+    Creates the semantic cache collection if needed and loads it for search.
+    """
+    _ensure_connection()
+    qa_cache = create_qa_cache_collection(model_name=config.OPENAI_EMBEDDING_MODEL)
+    qa_cache.load()
+    return qa_cache
+
+def get_seed_paths(model_name):
+    """
+    Returns the (embeddings, texts) file paths of the seed artifacts.
+    The file names contain a hash of the model, dimension and initial_texts, so editing the texts invalidates them.
+    """
+    digest = hashlib.sha256(json.dumps([model_name, get_embedding_dim(model_name), initial_texts], ensure_ascii=False).encode()).hexdigest()[:16]
+    embeddings_path = os.path.join(config.SEED_EMBEDDINGS_DIR, f"seed_embeddings_{digest}.npy")
+    texts_path = os.path.join(config.SEED_EMBEDDINGS_DIR, f"seed_texts_{digest}.json")
+    return embeddings_path, texts_path
+
+def load_seed_embeddings(model_name):
+    """
+    Loads the precomputed preprocessed texts and embeddings written by build_embeddings.py.
+    Returns (texts, embeddings), or None if the artifacts do not exist.
+    """
+    embeddings_path, texts_path = get_seed_paths(model_name)
+    if not (os.path.exists(embeddings_path) and os.path.exists(texts_path)):
+        return None
+
+    embeddings = np.load(embeddings_path)
+    with open(texts_path, encoding="utf-8") as f:
+        texts = json.load(f)
+    return texts, list(embeddings)
+
 def setup_collection():
     """
     Creates the collection and inserts initial data.
     """
     collection = create_collection(model_name=config.OPENAI_EMBEDDING_MODEL)
-    for text in initial_texts:
-        processed_text = preprocess_text(text);
-        embedding = generate_embeddings_openai(text, model_name=config.OPENAI_EMBEDDING_MODEL)
-        insert_texts(collection, processed_text, embedding)
+
+    # Use the precomputed seed embeddings if they exist for the current texts and model
+    seed = load_seed_embeddings(config.OPENAI_EMBEDDING_MODEL)
+    if seed is not None:
+        processed_texts, embeddings = seed
+        print(f"Loaded {len(processed_texts)} precomputed seed embeddings.")
+    else:
+        processed_texts = [preprocess_text(text) for text in initial_texts]
+
+        # Embed the texts in concurrent batches instead of one request per text
+        embeddings = get_embeddings(initial_texts, model_name=config.OPENAI_EMBEDDING_MODEL)
+        if embeddings is None:
+            # Fail with the real cause instead of leaving an empty collection without an index behind
+            utility.drop_collection(collection_name)
+            raise RuntimeError("Failed to generate embeddings for the initial texts")
+
+    insert_texts(collection, processed_texts, embeddings)
+
+    # Flush once after all inserts so the data is sealed into as few segments as possible
+    collection.flush()
     create_index(collection)
+
+    # Load the collection into memory once so searches do not have to
+    collection.load()
     return collection
 
 def initialize_database():
@@ -207,18 +543,26 @@ def initialize_database():
     Initializes the database by checking its existence.
     If it does not exist, it creates the database, collection, inserts texts, and creates an index.
     """
-    # Connect to Milvus
-    connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
-    
+    _ensure_connection()
+
     # Check if the database exists
     if database_name in db.list_database():
         print(f"Database '{database_name}' already exists. Connecting to it.")
-        connections.connect(host=MILVUS_HOST, port=MILVUS_PORT, db_name=database_name)
+        db.using_database(database_name)
         
         # Check if the collection exists
         if utility.has_collection(collection_name):
             print(f"Collection '{collection_name}' exists.")
-            return Collection(collection_name)
+            collection = Collection(collection_name)
+            if not is_collection_current(collection, config.OPENAI_EMBEDDING_MODEL):
+                # Searches against an outdated schema or metric would fail on every request
+                raise RuntimeError(
+                    f"Collection '{collection_name}' does not match the current embedding configuration "
+                    f"(FLOAT16_VECTOR, dim={get_embedding_dim(config.OPENAI_EMBEDDING_MODEL)}, {METRIC_TYPE} index). "
+                    "Run reset_database() to rebuild it."
+                )
+            collection.load()  # Load once at startup instead of on every search
+            return collection
         else:
             print(f"Collection '{collection_name}' does not exist. Creating collection and inserting data.")
             return setup_collection()
@@ -227,6 +571,31 @@ def initialize_database():
         remove_existing_database()
         return setup_collection()
 
+def attach_collections():
+    """
+    Connects to the existing database and loads the text and semantic cache collections for search.
+    Never creates, seeds, or drops anything, so it is safe to call from many server workers at once.
+    Raises RuntimeError if a collection is missing or does not match the current configuration.
+    """
+    _ensure_connection()
+
+    if database_name not in db.list_database():
+        raise RuntimeError(f"Database '{database_name}' does not exist. Run reset_database() (python main.py) to create it.")
+    db.using_database(database_name)
+
+    collections = []
+    for name in (collection_name, qa_cache_collection_name):
+        if not utility.has_collection(name):
+            raise RuntimeError(f"Collection '{name}' does not exist. Run reset_database() (python main.py) to create it.")
+        collection = Collection(name)
+        if not is_collection_current(collection, config.OPENAI_EMBEDDING_MODEL):
+            raise RuntimeError(f"Collection '{name}' does not match the current embedding configuration. Run reset_database() to rebuild it.")
+        collection.load()  # Load once at startup instead of on every search
+        collections.append(collection)
+
+    print(f"Attached to collections '{collection_name}' and '{qa_cache_collection_name}'.")
+    return tuple(collections)
+
 def reset_database():
     """
     Resets the database and collection, and re-inserts the initial data.
@@ -0,0 +1,7 @@
+# hypercorn_conf.py
+import multiprocessing
+
+# Serve the LINE webhook on port 5000 with one worker process per CPU core
+bind = ["0.0.0.0:5000"]
+workers = multiprocessing.cpu_count()
+worker_class = "asyncio"
@@ -1,34 +1,30 @@
-import openai
-import requests
-import json
-from pymilvus import connections, utility, db, Collection
-from database_operations import initialize_database, reset_database, search_similar_texts, generate_embeddings_openai
-from flask import Flask, request, jsonify
+import asyncio
+import os
+import sys
+import httpx
+import orjson
+from database_operations import attach_collections, initialize_qa_cache, reset_database, search_similar_texts, get_embeddings_async, search_cached_reply, insert_cached_reply, create_async_client, stream_openai_with_retry
+from quart import Quart, request
 import config  # Import the config file for API key and model configuration
 
-app = Flask(__name__)
+app = Quart(__name__)
 
-# Milvus connection details
-MILVUS_HOST = 'localhost'
-MILVUS_PORT = '19530'
+# Shared async HTTP client (HTTP/2, pooled connections) for OpenAI and LINE calls
+CLIENT = create_async_client()
 
-# Database and collection name variables
-database_name = "my_database"
-collection_name = "thai_text_embeddings"
-
-# Set the OpenAI API key from the config file
-openai.api_key = config.OPENAI_API_KEY
+# Request headers are built once; OpenAI calls use the shared OPENAI_HEADERS through the retry helpers in database_operations
+LINE_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {config.LINE_CHANNEL_ACCESS_TOKEN}"  # LINE access token from config
+}
 
 # Function to get a response from OpenAI Chat Completion API
-def get_chat_completion_response(user_question, context):
+async def get_chat_completion_response(user_question, context):
     """
     Sends the user question and the retrieved context to OpenAI Chat Completion API.
+    The response is streamed and the content deltas are accumulated until the model stops.
     """
     url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {config.OPENAI_API_KEY}"  # Set the OpenAI API Key from the config
-    }
     messages = [
         {"role": "system", "content": "คุณคือพนักงานของบริษัท ที.ที.ซอฟแวร์ โซลูชั่น จำกัด (T.T.Software Solution Co.,Ltd). กรุณาตอบคำถามเกี่ยวกับบริษัทฯ เป็นภาษาไทย โดยอ้างอิงจาก รายละเอียดที่เกี่ยวข้อง. คุณเป็นผู้ชาย."},
         {"role": "system", "content": f"รายละเอียดที่เกี่ยวข้อง: {context}"},
@@ -38,30 +34,42 @@ def get_chat_completion_response(user_question, context):
     data = {
         "model": config.CHAT_COMPLETION_MODEL,  # Use model from config
         "messages": messages,
-        "temperature": config.CHAT_COMPLETION_TEMPERATURE  # Use temperature from config
+        "temperature": config.CHAT_COMPLETION_TEMPERATURE,  # Use temperature from config
+        "stream": True  # Stream tokens as server-sent events
     }
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-        response.raise_for_status()
-        result = response.json()
-        return result['choices'][0]['message']['content']
-    except requests.exceptions.HTTPError as http_err:
+        parts = []
+        async with stream_openai_with_retry(CLIENT, url, data) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue  # Skip keep-alive blank lines
+                payload = line[len("data: "):]
+                if payload == "[DONE]":
+                    break
+                choices = orjson.loads(payload)['choices']
+                if not choices:
+                    continue
+                choice = choices[0]
+                content = choice['delta'].get('content')
+                if content:
+                    parts.append(content)
+                if choice.get('finish_reason') == 'stop':
+                    break  # Reply is complete, no need to wait for the end of the stream
+        return "".join(parts)
+    except httpx.HTTPStatusError as http_err:
         print(f"HTTP error occurred: {http_err}")
     except Exception as e:
         print(f"Error generating chat completion with OpenAI: {e}")
     return None
 
 # Function to send a reply to LINE user
-def send_line_reply(reply_token, message):
+async def send_line_reply(reply_token, message):
     """
     Sends a reply message back to the user via the LINE Messaging API.
     """
     url = "https://api.line.me/v2/bot/message/reply"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {config.LINE_CHANNEL_ACCESS_TOKEN}"  # LINE access token from config
-    }
 
     payload = {
         "replyToken": reply_token,
@@ -73,49 +81,122 @@ def send_line_reply(reply_token, message):
         ]
     }
 
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
+    response = await CLIENT.post(url, headers=LINE_HEADERS, content=orjson.dumps(payload))
     if response.status_code == 200:
         print('Reply sent successfully.')
     else:
         print(f"Failed to send reply: {response.status_code}, {response.text}")
 
-# Flask webhook route to receive messages from LINE
+# Attach to the collections once the server starts. Creating and seeding them happens only in the
+# parent process (see __main__), so several workers never drop or seed collections at the same time.
+@app.before_serving
+async def startup():
+    global collection, qa_cache
+    # Milvus calls are blocking, so run them in a worker thread
+    collection, qa_cache = await asyncio.to_thread(attach_collections)
+
+@app.after_serving
+async def shutdown():
+    await CLIENT.aclose()
+
+# Replies currently being generated, keyed by user input, so identical concurrent questions share one pipeline
+in_flight_replies = {}
+
+async def generate_reply(user_input):
+    """
+    Embeds the user input, searches for context, and returns the reply text to send.
+    """
+    # Generate embedding for the user message and find similar context
+    embeddings = await get_embeddings_async(CLIENT, [user_input], model_name=config.OPENAI_EMBEDDING_MODEL)
+    if embeddings is None:
+        return "Sorry, I couldn't generate a response."
+    embedding = embeddings[0]
+
+    # Search the semantic cache and the context collection at the same time
+    cached_reply, similar_texts = await asyncio.gather(
+        asyncio.to_thread(search_cached_reply, qa_cache, embedding),
+        asyncio.to_thread(search_similar_texts, collection, embedding, 4)
+    )
+
+    # Reply straight from the semantic cache if a near-identical question was answered recently
+    if cached_reply:
+        return cached_reply
+
+    # Format the context from the search results
+    context = "\n".join([result["Text"] for result in similar_texts])
+    if not context:
+        return "No relevant context found in the database."
+
+    # Get the AI response based on context and user input
+    response = await get_chat_completion_response(user_input, context)
+    if not response:
+        return "Sorry, I couldn't generate a response."
+
+    # Remember the reply for similar questions; a failed cache write must not cost the user the reply
+    try:
+        await asyncio.to_thread(insert_cached_reply, qa_cache, embedding, response)
+    except Exception as e:
+        print(f"Error storing reply in the semantic cache: {e}")
+    return response
+
+async def get_reply(user_input):
+    """
+    Returns the reply for the user input, joining an in-flight generation for the same input if there is one.
+    """
+    future = in_flight_replies.get(user_input)
+    if future is None:
+        future = asyncio.ensure_future(generate_reply(user_input))
+        in_flight_replies[user_input] = future
+        future.add_done_callback(lambda _: in_flight_replies.pop(user_input, None))
+
+    # Shield the shared future so one cancelled waiter does not cancel it for the others
+    return await asyncio.shield(future)
+
+async def handle_event(event):
+    """
+    Handles a single LINE message event: skips non-text messages, then generates and sends the reply.
+    """
+    message = event.get('message', {})
+    if message.get('type') != 'text':
+        return  # Stickers, images, etc. have no text to answer
+
+    user_input = message['text'].strip().lower()  # Get the user's message
+    reply_token = event['replyToken']  # Extract the replyToken
+
+    if not user_input:
+        await send_line_reply(reply_token, "Please send a text message.")
+        return
+
+    reply = await get_reply(user_input)
+    await send_line_reply(reply_token, reply)  # Send the reply to the user
+
+# Quart webhook route to receive messages from LINE
 @app.route('/webhook', methods=['POST'])
-def webhook():
-    body = request.get_json()
+async def webhook():
+    try:
+        body = orjson.loads(await request.get_data())
+    except orjson.JSONDecodeError:
+        return app.response_class(orjson.dumps({"status": "error", "message": "Invalid JSON body"}), status=400, mimetype="application/json")
+    if not isinstance(body, dict):
+        return app.response_class(orjson.dumps({"status": "error", "message": "JSON body must be an object"}), status=400, mimetype="application/json")
 
     # Check for the 'events' field, which contains message information
     if 'events' in body:
-        for event in body['events']:
-            if event['type'] == 'message':  # Handle message event
-                user_input = event['message']['text'].strip().lower()  # Get the user's message
-                reply_token = event['replyToken']  # Extract the replyToken
-
-                # Generate embedding for the user message and find similar context
-                embedding = generate_embeddings_openai(user_input, model_name=config.OPENAI_EMBEDDING_MODEL)
-                similar_texts = search_similar_texts(collection, embedding, 4)
-
-                # Format the context from the search results
-                context = "\n".join([result["Text"] for result in similar_texts])
-
-                if context:
-                    # Get the AI response based on context and user input
-                    response = get_chat_completion_response(user_input, context)
-                    if response:
-                        send_line_reply(reply_token, response)  # Send the reply to the user
-                    else:
-                        send_line_reply(reply_token, "Sorry, I couldn't generate a response.")
-                else:
-                    send_line_reply(reply_token, "No relevant context found in the database.")
-
-    return jsonify({"status": "success"}), 200
+        # Handle all message events of the request concurrently; one failing event must not fail the others
+        results = await asyncio.gather(*[handle_event(event) for event in body['events'] if event.get('type') == 'message'], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error handling LINE event: {result!r}")
+
+    return app.response_class(orjson.dumps({"status": "success"}), status=200, mimetype="application/json")
 
 # Start the application
 if __name__ == '__main__':
+    # Reset and create the collections once here, not in the workers, so they only connect to them
     reset_database()
+    initialize_qa_cache()
 
-    # Initialize the database and collection
-    collection = initialize_database()
-
-    # Start the Flask app to handle LINE webhooks
-    app.run(debug=True, port=5000)
+    # Replace this process with Hypercorn, which serves the app with multiple workers.
+    # hypercorn_conf.py and asgi.py are resolved from the current directory, so run it from this file's directory.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.execv(sys.executable, [sys.executable, "-m", "hypercorn", "-c", "file:hypercorn_conf.py", "asgi:app"])